@@ -1,12 +1,20 @@
 import argparse
+import fnmatch
 import os
+import re
+import shutil
 import subprocess
 import json
 import logging
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import tempfile
-from typing import List, Optional
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from colorama import init, Fore, Style
 
 # Initialize colorama
@@ -57,33 +65,42 @@ logger.propagate = (
 class Config:
     """Configuration for the scanner."""
 
-    DESIRED_DETECTOR_TYPES = [
-        2,
-        3,
-        7,
-        9,
-        15,
-        17,
-        18,
-        31,
-        39,
-        40,
-        48,
-        69,
-        71,
-        120,
-        177,
-        350,
-        353,
-        582,
-        584,
-        599,
-        737,
-        924,
-    ]
+    DESIRED_DETECTOR_TYPES = frozenset(
+        [
+            2,
+            3,
+            7,
+            9,
+            15,
+            17,
+            18,
+            31,
+            39,
+            40,
+            48,
+            69,
+            71,
+            120,
+            177,
+            350,
+            353,
+            582,
+            584,
+            599,
+            737,
+            924,
+        ]
+    )
     UNDESIRED_TERMS = ["example", "test", "dummy", "sample"]
+    _UNDESIRED_RE = re.compile("|".join(map(re.escape, UNDESIRED_TERMS)), re.IGNORECASE)
     MAX_WORKERS = 4
+    EXECUTOR = None  # "thread" or "process"; None picks by MAX_WORKERS
+    SEARCH_WORKERS = 8
+    SCAN_BATCH_PER_WORKER = 2  # Images per secret-scanner batch, per worker
+    SKOPEO_PARALLEL_COPIES = os.environ.get("SKOPEO_PARALLEL", "16")
     OUTPUT_DIR = "/app/output"
+    PRETTY_OUTPUT = False
+    CAT_MAX_BYTES = 256 * 1024  # Max bytes of a sensitive file kept in findings
 
     SENSITIVE_FILES = [
         {"name": "SHADOW", "pattern": "shadow", "action": "shadow"},
@@ -113,12 +130,30 @@ class HubClient:
 
     BASE_URL = "https://hub.docker.com/v2"
 
+    def __init__(self):
+        # Reuse connections across searches and tag lookups instead of paying a
+        # TLS handshake per request; retry rate limits and transient errors.
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip"})
+        self.session.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=16,
+                pool_maxsize=16,
+                max_retries=Retry(
+                    total=5,
+                    backoff_factor=0.3,
+                    status_forcelist=[429, 500, 502, 503, 504],
+                ),
+            ),
+        )
+
     def search(self, term: str) -> List[str]:
         """Search for repositories on Docker Hub."""
         url = f"{self.BASE_URL}/search/repositories/"
         params = {"query": term, "page_size": 100}
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             data = response.json()
             return [repo["repo_name"] for repo in data.get("results", [])]
@@ -133,7 +168,7 @@ class HubClient:
 
         url = f"{self.BASE_URL}/repositories/{repo_name}/tags"
         try:
-            response = requests.get(url, params={"page_size": 10})
+            response = self.session.get(url, params={"page_size": 10})
             if response.status_code == 404:
                 return None
             response.raise_for_status()
@@ -197,6 +232,10 @@ class SkopeoClient:
             "linux",  # Ensure we get linux images
             "--retry-times",
             "3",  # Retry on failure
+            "--image-parallel-copies",
+            Config.SKOPEO_PARALLEL_COPIES,  # Fetch layers concurrently
+            "--dest-compress=false",  # Keep layers as served, no recompression
+            "--preserve-digests",
             f"docker://{image_name}",
             f"dir:{dest_path}",
         ]
@@ -217,8 +256,31 @@ class FileScanner:
     def __init__(self):
         self.findings = []
 
+        # Action name -> (reader run in the read pool, reporter run on the
+        # scanning thread). Actions without a reader are reported right away.
+        self._actions = {
+            "shadow": (self._read_shadow, self._check_shadow),
+            "cat": (self._read_file, self._cat_file),
+            "exist": (None, self._report_exist),
+        }
+
+        # Combine every filename pattern into one regex so each file is matched
+        # once; the matching rule is identified by its named group.
+        self._rules = []
+        groups = []
+        for check in Config.SENSITIVE_FILES:
+            if check["pattern"] == ".git/config":
+                continue
+            group = f"r{len(self._rules)}"
+            self._rules.append((check["name"], *self._actions[check["action"]]))
+            groups.append(f"(?P<{group}>{fnmatch.translate(check['pattern'])})")
+        self._regex = re.compile("|".join(groups), re.IGNORECASE)
+
     def add_finding(self, message: str, console: bool = False, level: str = "INFO"):
         """Add a finding to the list and optionally log to console."""
+        # Paths from scandir/tar may carry undecodable bytes as surrogates,
+        # which orjson refuses to serialize; replace them instead.
+        message = message.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
         self.findings.append(message)
 
         if console:
@@ -227,82 +289,196 @@ class FileScanner:
             else:
                 logger.info(message)
 
-    def scan(self, directory: str, repo_name: str) -> List[str]:
-        for check in Config.SENSITIVE_FILES:
-            title = check["name"]
-            pattern = check["pattern"]
-            action_type = check["action"]
-
-            if pattern == ".git/config":
-                for root, dirs, files in os.walk(directory):
-                    if ".git" in dirs:
-                        git_dir = os.path.join(root, ".git")
-                        config_file = os.path.join(git_dir, "config")
-                        if os.path.exists(config_file):
-                            self.add_finding(
-                                f"Found GIT CONFIG: {git_dir}",
-                                console=True,
-                                level="WARNING",
-                            )
-                            self._cat_file(config_file)
+    def scan(
+        self, directory: str, repo_name: str, members: Optional[List[str]] = None
+    ) -> List[str]:
+        """
+        Scan an extracted filesystem for sensitive files.
+        If members (paths relative to directory, as listed by tar) is
+        non-empty, only those paths are checked and the tree is not walked.
+        """
+        if members:
+            entries = self._iter_members(directory, members)
+        else:
+            entries = (
+                (entry.path, entry.name, entry.is_dir(follow_symlinks=False))
+                for entry in self._walk(directory)
+            )
+
+        # Matching files are only queued during the walk; their contents are
+        # read concurrently afterwards and reported in walk order.
+        to_read = []
+        for path, name, is_dir in entries:
+            if is_dir:
+                if name == ".git":
+                    config_file = os.path.join(path, "config")
+                    if os.path.exists(config_file):
+                        self.add_finding(
+                            f"Found GIT CONFIG: {path}",
+                            console=True,
+                            level="WARNING",
+                        )
+                        to_read.append((*self._actions["cat"], config_file))
+                continue
+
+            match = self._regex.match(name)
+            if not match:
+                continue
+
+            # Symlinks to directories are listed as non-directories; like
+            # os.walk, don't report them as files
+            if os.path.isdir(path):
+                continue
+
+            title, reader, reporter = self._rules[int(match.lastgroup[1:])]
+            if reader is None:
+                reporter(path, title)
             else:
-                for root, dirs, files in os.walk(directory):
-                    for filename in files:
-                        if self._match_pattern(filename, pattern):
-                            filepath = os.path.join(root, filename)
-                            if action_type == "shadow":
-                                self._check_shadow(filepath)
-                            elif action_type == "cat":
-                                self._cat_file(filepath)
-                            else:
-                                self.add_finding(
-                                    f"Found {title}: {filepath}",
-                                    console=True,
-                                    level="WARNING",
-                                )
+                to_read.append((reader, reporter, path))
+
+        if to_read:
+            with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS * 2) as executor:
+                futures = [executor.submit(reader, path) for reader, _, path in to_read]
+                for (_, reporter, _), future in zip(to_read, futures):
+                    reporter(*future.result())
         return self.findings
 
-    def _match_pattern(self, filename: str, pattern: str) -> bool:
-        import fnmatch
+    @staticmethod
+    def _walk(root: str) -> Iterator[os.DirEntry]:
+        """
+        Yield every entry below root using an explicit os.scandir stack.
+        .git directories are yielded but not descended into; the scanner
+        only probes their config file. _iter_members mirrors this for tar
+        listings, deriving .git directories from the paths inside them.
+        """
+        stack = [root]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False) and entry.name != ".git":
+                        stack.append(entry.path)
+                    yield entry
+
+    @staticmethod
+    def _iter_members(
+        directory: str, members: List[str]
+    ) -> Iterator[Tuple[str, str, bool]]:
+        """Yield (path, name, is_dir) for tar member names, once per path."""
+        # Later layers list the same paths again; tar marks directories with
+        # a trailing slash.
+        seen = set()
+        for member in members:
+            relpath = os.path.normpath(member.lstrip("/"))
+            if relpath in seen or relpath in (".", "..") or relpath.startswith("../"):
+                continue
+            seen.add(relpath)
+
+            is_dir = member.endswith("/")
+            # Layers don't always carry separate directory entries, so a .git
+            # directory is derived from the paths inside it. Those paths are
+            # not matched themselves, as _walk doesn't descend into .git.
+            head, sep, _ = f"/{relpath}".partition("/.git/")
+            if sep:
+                relpath = f"{head}/.git".lstrip("/")
+                if relpath in seen:
+                    continue
+                seen.add(relpath)
+                is_dir = True
 
-        return fnmatch.fnmatch(filename.lower(), pattern.lower())
+            yield (
+                os.path.join(directory, relpath),
+                os.path.basename(relpath),
+                is_dir,
+            )
 
-    def _check_shadow(self, filepath: str):
+    @staticmethod
+    def _read_file(filepath: str) -> Tuple[str, Optional[bytes]]:
         try:
-            with open(filepath, "r", errors="ignore") as f:
-                content = f.read()
-                if "$" in content:
-                    self.add_finding(
-                        f"Found SHADOW file: {filepath}", console=True, level="WARNING"
-                    )
-                    for line in content.splitlines():
-                        if "$" in line:
-                            self.add_finding(
-                                f"Shadow content: {line}", console=True, level="WARNING"
-                            )
+            with open(filepath, "rb") as f:
+                # One byte past the cap tells _cat_file the file was truncated
+                return filepath, f.read(Config.CAT_MAX_BYTES + 1)
         except Exception as e:
             logger.error(f"Error reading {filepath}: {e}")
+            return filepath, None
 
-    def _cat_file(self, filepath: str):
-        self.add_finding(
-            f"Found sensitive file: {filepath}", console=True, level="WARNING"
-        )
+    @staticmethod
+    def _read_shadow(filepath: str) -> Tuple[str, Optional[List[bytes]]]:
+        """Stream a shadow candidate and keep only lines holding a hash."""
         try:
-            with open(filepath, "r", errors="ignore") as f:
-                self.add_finding(f"Content of {filepath}:\n{f.read()}")
+            lines = []
+            with open(filepath, "rb") as f:
+                for line in f:
+                    if b"$" in line:
+                        lines.append(line.rstrip(b"\r\n"))
+            return filepath, lines
         except Exception as e:
             logger.error(f"Error reading {filepath}: {e}")
+            return filepath, None
+
+    def _check_shadow(self, filepath: str, lines: Optional[List[bytes]]):
+        if not lines:
+            return
+
+        self.add_finding(
+            f"Found SHADOW file: {filepath}", console=True, level="WARNING"
+        )
+        for line in lines:
+            self.add_finding(
+                f"Shadow content: {line.decode(errors='ignore')}",
+                console=True,
+                level="WARNING",
+            )
+
+    def _report_exist(self, filepath: str, title: str):
+        self.add_finding(f"Found {title}: {filepath}", console=True, level="WARNING")
+
+    def _cat_file(self, filepath: str, content: Optional[bytes]):
+        self.add_finding(
+            f"Found sensitive file: {filepath}", console=True, level="WARNING"
+        )
+        if content is None:
+            return
+
+        header = f"Content of {filepath}"
+        if len(content) > Config.CAT_MAX_BYTES:
+            content = content[: Config.CAT_MAX_BYTES]
+            header += f" (truncated to {Config.CAT_MAX_BYTES} bytes)"
+        self.add_finding(f"{header}:\n{content.decode(errors='ignore')}")
 
 
 class Klepto2:
     def __init__(self):
         self.hub_client = HubClient()
         self.skopeo_client = SkopeoClient()
+        # Timestamp shared by all images of a run, set in run()
+        self._run_ts: Optional[str] = None
+        # Worker pool and task function for image preparation, set in run()
+        self._executor = None
+        self._prepare = None
 
         # Setup output directory
         os.makedirs(Config.OUTPUT_DIR, exist_ok=True)
 
-    def extract_image(self, image_dir: str, extract_root: str):
+    @staticmethod
+    def _is_custom_registry(image_name: str) -> bool:
+        """True if the first path segment is a registry domain (contains '.')."""
+        first, sep, _ = image_name.partition("/")
+        return bool(sep) and "." in first
+
+    @staticmethod
+    def _utc_timestamp() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def extract_image(self, image_dir: str, extract_root: str) -> List[str]:
+        """
+        Extract all image layers into extract_root.
+        Returns the member names tar reported, so the rootfs does not have to
+        be walked again to find sensitive files.
+        """
         logger.info(f"Extracting layers from {image_dir} to {extract_root}")
         os.makedirs(extract_root, exist_ok=True)
 
@@ -331,24 +507,77 @@ class Klepto2:
 
         # Fallback: if manifest parsing failed or yielded no files, try all non-metadata files
         if not files_to_extract:
-            files_to_extract = [
-                f
-                for f in os.listdir(image_dir)
-                if f not in ["manifest.json", "version"]
-            ]
-
+            with os.scandir(image_dir) as it:
+                files_to_extract = [
+                    entry.name
+                    for entry in it
+                    if entry.is_file()
+                    and entry.name not in ["manifest.json", "version"]
+                ]
+
+        # Images may reference the same layer blob more than once
+        files_to_extract = list(dict.fromkeys(files_to_extract))
+
+        # Layers overwrite each other's files, so they must be applied in
+        # manifest order
+        members = []
         for filename in files_to_extract:
-            filepath = os.path.join(image_dir, filename)
-            try:
-                # Use system tar for performance
-                subprocess.run(
-                    ["tar", "-xf", filepath, "-C", extract_root],
+            members.extend(
+                self._extract_layer(os.path.join(image_dir, filename), extract_root)
+            )
+        return members
+
+    @staticmethod
+    def _layer_decompressor(filepath: str) -> Optional[List[str]]:
+        """
+        Pick an external decompressor for a layer based on its magic bytes.
+        Returns None if tar should read the layer file itself.
+        """
+        try:
+            with open(filepath, "rb") as f:
+                magic = f.read(4)
+        except OSError:
+            return None
+
+        if magic == b"\x28\xb5\x2f\xfd" and shutil.which("zstd"):
+            return ["zstd", "-d", "-T0", "-c", filepath]
+        if magic[:2] == b"\x1f\x8b" and shutil.which("pigz"):
+            return ["pigz", "-dc", filepath]
+        return None
+
+    def _extract_layer(self, filepath: str, extract_root: str) -> List[str]:
+        """Extract one layer tarball and return the member names tar listed."""
+        # Use system tar for performance; -v lists each member on stdout as it
+        # is extracted.
+        tar_cmd = ["tar", "-xv", "-C", extract_root, "--quoting-style=literal"]
+        decompress_cmd = self._layer_decompressor(filepath)
+        try:
+            if decompress_cmd is None:
+                result = subprocess.run(
+                    tar_cmd + ["-f", filepath],
                     check=False,
-                    stdout=subprocess.DEVNULL,
+                    stdout=subprocess.PIPE,
                     stderr=subprocess.DEVNULL,
                 )
-            except Exception as e:
-                logger.error(f"Failed to extract {filepath}: {e}")
+                output = result.stdout
+            else:
+                decompress = subprocess.Popen(
+                    decompress_cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+                )
+                tar = subprocess.Popen(
+                    tar_cmd + ["-f", "-"],
+                    stdin=decompress.stdout,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL,
+                )
+                # Close our copy so the decompressor gets SIGPIPE if tar exits early
+                decompress.stdout.close()
+                output, _ = tar.communicate()
+                decompress.wait()
+            return os.fsdecode(output).splitlines()
+        except Exception as e:
+            logger.error(f"Failed to extract {filepath}: {e}")
+            return []
 
     def run_trufflehog(self, directory: str, output_file: str):
         cmd = ["trufflehog", "filesystem", directory, "--json"]
@@ -360,47 +589,56 @@ class Klepto2:
         except Exception as e:
             logger.error(f"TruffleHog failed: {e}")
 
-    def run_gitleaks(self, directory: str, output_file: str):
+    def run_gitleaks(self, directory: str) -> List[dict]:
+        # The JSON report is written to stdout and decoded in memory; -v is
+        # left out so verbose findings don't get mixed into the report.
         cmd = [
             "gitleaks",
             "detect",
             "--no-git",
-            "-v",
             "-s",
             directory,
             "-f",
             "json",
             "-r",
-            output_file,
+            "/dev/stdout",
         ]
         try:
-            # Suppress stdout/stderr to keep logs clean
-            subprocess.run(
-                cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False
+            result = subprocess.run(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False
             )
         except Exception as e:
             logger.error(f"Gitleaks failed: {e}")
+            return []
+
+        if not result.stdout.strip():
+            return []
+        try:
+            return orjson.loads(result.stdout)
+        except orjson.JSONDecodeError:
+            logger.error("Failed to parse Gitleaks output")
+            return []
 
     def parse_trufflehog_results(self, input_file: str) -> List[dict]:
         if not os.path.exists(input_file):
             return []
 
-        all_data = []
-        with open(input_file, "r") as f:
+        filtered_data = []
+        with open(input_file, "rb") as f:
             for line in f:
-                if line.strip():
-                    try:
-                        all_data.append(json.loads(line))
-                    except json.JSONDecodeError:
-                        pass
+                if not line.strip():
+                    continue
+                try:
+                    obj = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue
 
-        filtered_data = []
-        for obj in all_data:
-            raw = obj.get("Raw", "")
-            detector_type = obj.get("DetectorType")
+                detector_type = obj.get("DetectorType")
+                if detector_type not in Config.DESIRED_DETECTOR_TYPES:
+                    continue
 
-            if detector_type in Config.DESIRED_DETECTOR_TYPES:
-                if raw and any(term in raw.lower() for term in Config.UNDESIRED_TERMS):
+                raw = obj.get("Raw", "")
+                if raw and Config._UNDESIRED_RE.search(raw):
                     continue
 
                 filtered_data.append(
@@ -413,23 +651,24 @@ class Klepto2:
                 )
         return filtered_data
 
-    def process_image(self, image_name: str) -> Optional[str]:
-        # Resolve tag if missing
-        if ":" not in image_name:
-            # Check if it's a custom registry
-            is_custom_registry = (
-                len(image_name.split("/")) > 1 and "." in image_name.split("/")[0]
-            )
+    def resolve_image_name(self, image_name: str) -> str:
+        """Append the best available tag if the image name has none."""
+        if ":" in image_name:
+            return image_name
 
-            if is_custom_registry:
-                image_name += ":latest"
-            else:
-                tag = self.hub_client.get_best_tag(image_name)
-                if tag:
-                    image_name = f"{image_name}:{tag}"
-                else:
-                    image_name += ":latest"
+        # Check if it's a custom registry
+        if self._is_custom_registry(image_name):
+            return f"{image_name}:latest"
 
+        tag = self.hub_client.get_best_tag(image_name)
+        return f"{image_name}:{tag or 'latest'}"
+
+    def prepare_image(self, image_name: str, extracts_root: str) -> Optional[dict]:
+        """
+        Resolve, inspect, pull and extract one image and scan it for sensitive
+        files. Returns the partial result, or None if the pull failed.
+        """
+        image_name = self.resolve_image_name(image_name)
         logger.info(f"Processing {image_name}...")
 
         # Inspect image metadata
@@ -459,92 +698,243 @@ class Klepto2:
 
         safe_name = image_name.replace("/", "_").replace(":", "_")
 
-        # Use a temporary directory for the entire process of this image
+        # Layers go into their own directory under extracts_root, where the
+        # secret scanners later run once for all images of the run. mkdtemp
+        # keeps it unique even if two inputs map to the same safe_name.
+        extract_dir = tempfile.mkdtemp(prefix=f"{safe_name}_", dir=extracts_root)
+
+        # Use a temporary directory for the downloaded image data
         with tempfile.TemporaryDirectory() as temp_dir:
             image_dir = os.path.join(temp_dir, "image_data")
             os.makedirs(image_dir, exist_ok=True)
 
-            extract_dir = os.path.join(temp_dir, "extracted")
-
             if not self.skopeo_client.pull_image(image_name, image_dir):
                 return None
 
-            self.extract_image(image_dir, extract_dir)
+            members = self.extract_image(image_dir, extract_dir)
+
+        # File Pattern Scan
+        file_scanner = FileScanner()
+        file_findings = file_scanner.scan(extract_dir, image_name, members)
 
-            # 1. File Pattern Scan
-            file_scanner = FileScanner()
-            file_findings = file_scanner.scan(extract_dir, image_name)
+        return {
+            "image": image_name,
+            "safe_name": safe_name,
+            "extract_name": os.path.basename(extract_dir),
+            "image_metadata": image_info,
+            "file_findings": file_findings,
+        }
 
-            # 2. TruffleHog Scan
+    def scan_extracts(
+        self, extracts_root: str
+    ) -> Tuple[Dict[str, List[dict]], Dict[str, List[dict]]]:
+        """
+        Run TruffleHog and Gitleaks once over all extracted images.
+        Returns both tools' findings keyed by the image directory they were
+        found in.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
             th_output_tmp = os.path.join(temp_dir, "trufflehog.json")
-            self.run_trufflehog(extract_dir, th_output_tmp)
+            self.run_trufflehog(extracts_root, th_output_tmp)
             trufflehog_findings = self.parse_trufflehog_results(th_output_tmp)
 
-            # 3. Gitleaks Scan
-            gl_output_tmp = os.path.join(temp_dir, "gitleaks.json")
-            self.run_gitleaks(extract_dir, gl_output_tmp)
+        gitleaks_findings = self.run_gitleaks(extracts_root)
+
+        return (
+            self._split_by_image(
+                trufflehog_findings,
+                extracts_root,
+                lambda finding: (
+                    ((finding.get("SourceMetadata") or {}).get("Data") or {})
+                    .get("Filesystem", {})
+                    .get("file")
+                ),
+            ),
+            self._split_by_image(
+                gitleaks_findings, extracts_root, lambda finding: finding.get("File")
+            ),
+        )
+
+    @staticmethod
+    def _split_by_image(
+        findings: List[dict], extracts_root: str, get_path
+    ) -> Dict[str, List[dict]]:
+        """Group findings by the top-level directory of their file path."""
+        by_image = {}
+        for finding in findings:
+            path = get_path(finding) or ""
+            if os.path.isabs(path):
+                path = os.path.relpath(path, extracts_root)
+            extract_name = os.path.normpath(path).split(os.sep, 1)[0]
+            by_image.setdefault(extract_name, []).append(finding)
+        return by_image
+
+    def write_result(
+        self,
+        prepared: dict,
+        trufflehog_findings: List[dict],
+        gitleaks_findings: List[dict],
+    ) -> str:
+        """Combine all findings of one image and write its results file."""
+        image_name = prepared["image"]
+        final_result = {
+            "image": image_name,
+            "scan_timestamp": self._run_ts or self._utc_timestamp(),
+            "image_metadata": prepared["image_metadata"],
+            "file_findings": prepared["file_findings"],
+            "trufflehog_findings": trufflehog_findings,
+            "gitleaks_findings": gitleaks_findings,
+        }
+
+        output_file = os.path.join(
+            Config.OUTPUT_DIR, f"results_{prepared['safe_name']}.json"
+        )
+        option = orjson.OPT_INDENT_2 if Config.PRETTY_OUTPUT else 0
+        with open(output_file, "wb") as f:
+            f.write(orjson.dumps(final_result, option=option))
+
+        logger.info(f"Scan complete for {image_name}. Results saved to {output_file}")
+        return output_file
+
+    def _search_term(self, term: str) -> List[str]:
+        logger.info(f"Searching for: {term}")
+        found = self.hub_client.search(term)
+        logger.info(f"Found {len(found)} images for '{term}'")
+        return found
+
+    def search_terms(self, terms: List[str]) -> List[List[str]]:
+        """Search Docker Hub for all terms concurrently, keeping input order."""
+        if not terms:
+            return []
+        with ThreadPoolExecutor(max_workers=Config.SEARCH_WORKERS) as executor:
+            return list(executor.map(self._search_term, terms))
+
+    def resolve_image_names(self, image_names: List[str]) -> List[str]:
+        """Resolve tags for all image names concurrently, keeping input order."""
+        if not image_names:
+            return []
+        with ThreadPoolExecutor(max_workers=Config.SEARCH_WORKERS) as executor:
+            return list(executor.map(self.resolve_image_name, image_names))
 
-            gitleaks_findings = []
-            if os.path.exists(gl_output_tmp):
+    def _new_executor(self):
+        """Create the worker pool for image preparation and its task function."""
+        executor_type = Config.EXECUTOR or (
+            "process" if Config.MAX_WORKERS > 1 else "thread"
+        )
+        if executor_type == "process":
+            # Worker processes don't see Config changes made after import when
+            # they are spawned, so hand them the current settings explicitly.
+            settings = {k: v for k, v in vars(Config).items() if k.isupper()}
+            executor = ProcessPoolExecutor(
+                max_workers=Config.MAX_WORKERS,
+                initializer=_init_worker,
+                initargs=(settings, logger.level),
+            )
+            return executor, _prepare_image_worker
+        return ThreadPoolExecutor(max_workers=Config.MAX_WORKERS), self.prepare_image
+
+    def _submit_batch(self, image_names: List[str]) -> Tuple[str, dict]:
+        """Queue pull, extraction and file scan for a batch of images."""
+        # All images of the batch are extracted side by side under one
+        # temporary directory so the secret scanners cover them in a single
+        # invocation.
+        extracts_root = tempfile.mkdtemp(prefix="klepto2_")
+        future_to_image = {}
+        for img in image_names:
+            try:
+                future = self._executor.submit(self._prepare, img, extracts_root)
+            except BrokenProcessPool:
+                # A worker died (e.g. OOM-killed on a large image); images it
+                # took down with it are reported by _finish_batch. Continue
+                # with a fresh pool.
+                logger.warning("Worker pool crashed, starting a new one")
+                self._executor.shutdown(wait=False)
+                self._executor, self._prepare = self._new_executor()
+                future = self._executor.submit(self._prepare, img, extracts_root)
+            future_to_image[future] = img
+        return extracts_root, future_to_image
+
+    def _finish_batch(self, extracts_root: str, future_to_image: dict):
+        """Wait for a batch, run the secret scanners and write its results."""
+        try:
+            # 1. Collect the pulled, extracted and file-scanned images
+            prepared_images = []
+            for future in as_completed(future_to_image):
+                image_name = future_to_image[future]
                 try:
-                    with open(gl_output_tmp, "r") as f:
-                        gitleaks_findings = json.load(f)
-                except json.JSONDecodeError:
-                    pass
-
-            # Combine all results
-            final_result = {
-                "image": image_name,
-                "scan_timestamp": os.popen("date -u +%Y-%m-%dT%H:%M:%SZ")
-                .read()
-                .strip(),
-                "image_metadata": image_info,
-                "file_findings": file_findings,
-                "trufflehog_findings": trufflehog_findings,
-                "gitleaks_findings": gitleaks_findings,
-            }
+                    prepared = future.result()
+                except BrokenProcessPool:
+                    logger.error(f"{image_name} failed: a worker process crashed")
+                    continue
+                except Exception as exc:
+                    logger.error(f"{image_name} generated an exception: {exc}")
+                    continue
+                if prepared:
+                    prepared_images.append(prepared)
 
-            output_file = os.path.join(Config.OUTPUT_DIR, f"results_{safe_name}.json")
-            with open(output_file, "w") as f:
-                json.dump(final_result, f, indent=4)
+            if not prepared_images:
+                return
 
+            # 2. TruffleHog and Gitleaks run once over the whole batch,
+            # amortizing their startup cost
             logger.info(
-                f"Scan complete for {image_name}. Results saved to {output_file}"
+                f"Running TruffleHog and Gitleaks on {len(prepared_images)} images"
             )
-            return output_file
+            try:
+                trufflehog_by_image, gitleaks_by_image = self.scan_extracts(
+                    extracts_root
+                )
+            except Exception as exc:
+                # Still write the file findings we already have
+                logger.error(f"Secret scanners generated an exception: {exc}")
+                trufflehog_by_image, gitleaks_by_image = {}, {}
+
+            # 3. One results file per image
+            for prepared in prepared_images:
+                extract_name = prepared["extract_name"]
+                try:
+                    self.write_result(
+                        prepared,
+                        trufflehog_by_image.get(extract_name, []),
+                        gitleaks_by_image.get(extract_name, []),
+                    )
+                except Exception as exc:
+                    logger.error(f"{prepared['image']} generated an exception: {exc}")
+        finally:
+            shutil.rmtree(extracts_root, ignore_errors=True)
 
     def run(self, inputs: List[str], mode: str):
         image_names = []
 
         if mode == "search":
-            for term in inputs:
-                logger.info(f"Searching for: {term}")
-                found = self.hub_client.search(term)
-                logger.info(f"Found {len(found)} images for '{term}'")
+            for found in self.search_terms(inputs):
                 image_names.extend(found)
         elif mode == "image":
             image_names = inputs
         elif mode == "mixed":
-            for term in inputs:
-                # Detect if input is a specific image or a search term
-                # It's an image if:
-                # 1. It has a tag (contains ':') e.g. "ubuntu:latest"
-                # 2. It comes from a registry (domain contains '.') e.g. "quay.io/coreos/etcd"
-                is_image = ":" in term or (
-                    len(term.split("/")) > 1 and "." in term.split("/")[0]
-                )
+            # Detect if input is a specific image or a search term
+            # It's an image if:
+            # 1. It has a tag (contains ':') e.g. "ubuntu:latest"
+            # 2. It comes from a registry (domain contains '.') e.g. "quay.io/coreos/etcd"
+            is_image = {
+                term: ":" in term or self._is_custom_registry(term) for term in inputs
+            }
+
+            # Run all searches up front, then merge in input order
+            terms = [term for term in inputs if not is_image[term]]
+            search_results = dict(zip(terms, self.search_terms(terms)))
 
-                if is_image:
+            for term in inputs:
+                if is_image[term]:
                     logger.info(f"Adding specific image: {term}")
                     image_names.append(term)
                 else:
-                    logger.info(f"Searching for: {term}")
-                    found = self.hub_client.search(term)
-                    logger.info(f"Found {len(found)} images for '{term}'")
-                    image_names.extend(found)
+                    image_names.extend(search_results[term])
 
-        # Remove duplicates
-        image_names = list(set(image_names))
+        # Remove duplicates, keeping first-seen order. Tags are resolved first
+        # so e.g. "nginx" and "nginx:latest" are only scanned once.
+        image_names = list(dict.fromkeys(image_names))
+        image_names = list(dict.fromkeys(self.resolve_image_names(image_names)))
 
         logger.info(
             f"Identified {len(image_names)} unique images to scan: {image_names}"
@@ -558,23 +948,54 @@ class Klepto2:
             f"Starting scan of {len(image_names)} images with {Config.MAX_WORKERS} workers."
         )
 
-        with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as executor:
-            future_to_image = {
-                executor.submit(self.process_image, img): img for img in image_names
-            }
-            for future in as_completed(future_to_image):
-                image_name = future_to_image[future]
-                try:
-                    future.result()
-                except Exception as exc:
-                    logger.error(f"{image_name} generated an exception: {exc}")
+        self._run_ts = self._utc_timestamp()
+        # Images are handled in batches so extracted filesystems don't pile up
+        # for the whole run. The next batch is queued before the current one
+        # is scanned, so workers keep pulling while the secret scanners run;
+        # at most two batches are on disk at a time.
+        batch_size = Config.MAX_WORKERS * Config.SCAN_BATCH_PER_WORKER
+        self._executor, self._prepare = self._new_executor()
+        pending = None
+        try:
+            for start in range(0, len(image_names), batch_size):
+                submitted = self._submit_batch(image_names[start : start + batch_size])
+                if pending:
+                    self._finish_batch(*pending)
+                pending = submitted
+            if pending:
+                self._finish_batch(*pending)
+                pending = None
+        finally:
+            if pending:
+                shutil.rmtree(pending[0], ignore_errors=True)
+            self._executor.shutdown()
 
         logger.info("All scans completed. Exiting.")
 
 
+# Per-process scanner used by ProcessPoolExecutor workers
+_worker_klepto: Optional[Klepto2] = None
+
+
+def _init_worker(settings: dict, log_level: int):
+    global _worker_klepto
+
+    for key, value in settings.items():
+        setattr(Config, key, value)
+    logger.setLevel(log_level)
+
+    _worker_klepto = Klepto2()
+
+
+def _prepare_image_worker(image_name: str, extracts_root: str) -> Optional[dict]:
+    return _worker_klepto.prepare_image(image_name, extracts_root)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Klepto2: Scan Docker images for secrets."
+        description="Klepto2: Scan Docker images for secrets.",
+        epilog="Environment: SKOPEO_PARALLEL sets the number of layers skopeo "
+        "downloads in parallel per image (default: 16).",
     )
 
     # Input arguments
@@ -603,7 +1024,18 @@ if __name__ == "__main__":
         default=Config.MAX_WORKERS,
         help="Number of concurrent workers",
     )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default=Config.EXECUTOR,
+        help="Run image scans in threads or processes (default: process if more than one worker)",
+    )
     parser.add_argument("--output", default=Config.OUTPUT_DIR, help="Output directory")
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Write indented JSON results (default: compact)",
+    )
     parser.add_argument(
         "--quiet",
         "-q",
@@ -617,7 +1049,9 @@ if __name__ == "__main__":
         logger.setLevel(logging.CRITICAL)
 
     Config.MAX_WORKERS = args.workers
+    Config.EXECUTOR = args.executor
     Config.OUTPUT_DIR = args.output
+    Config.PRETTY_OUTPUT = args.pretty
 
     # Collect inputs
     target_inputs = args.inputs